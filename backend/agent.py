@@ -1,15 +1,11 @@
 import operator
-import json
 from typing import TypedDict, Annotated, List
-from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, ToolMessage
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, ToolMessage, SystemMessage
 from langchain_core.tools import tool
 from langchain_openai import ChatOpenAI
 from langgraph.graph import StateGraph, START, END
-
-# --- CORRECTED IMPORT STATEMENTS ---
-# `ToolExecutor` is now imported from a specific submodule.
 from langgraph.prebuilt import ToolNode
-from langgraph.prebuilt import ToolExecutor
+from langgraph.types import Send
 
 # --- LangGraph State Definition ---
 class AgentState(TypedDict):
@@ -24,6 +20,8 @@ class AgentState(TypedDict):
         attendees: A list of attendees for the event.
         calendar_check_result: The result from the calendar availability check.
         action_needed: A flag to indicate if a tool action is needed.
+        history_summary: A rolling summary of older, pruned conversation turns.
+        summarized_upto: Index into messages below which turns are summarized.
     """
     messages: Annotated[list[BaseMessage], operator.add]
     summary: str | None
@@ -32,33 +30,54 @@ class AgentState(TypedDict):
     attendees: List[str] | None
     calendar_check_result: str | None
     action_needed: str | None
+    history_summary: str | None
+    summarized_upto: int | None
 
 # --- Define Tools (from backend/tools.py) ---
 # We need to wrap our functions with @tool decorator to make them available to the agent.
 # Note: In a real application, you would import these from the tools.py file.
 # We'll define them here for a self-contained example.
 
-from backend.tools import check_calendar_availability, create_google_calendar_event, get_current_datetime
+from backend.tools import (
+    check_calendar_availability_async,
+    check_calendar_availability_bulk_async,
+    create_google_calendar_event_async,
+    get_current_datetime,
+)
+
+# The tools are async so Calendar API round-trips never block the event loop;
+# backend/tools.py bounds their concurrency with a semaphore so parallel
+# fan-out can't trip the per-user API quota.
 
 @tool
-def check_availability(start_time: str, end_time: str) -> str:
+async def check_availability(start_time: str, end_time: str) -> str:
     """
     Checks the user's primary Google Calendar for busy time slots within a given time range.
     Provide the start and end time in ISO 8601 format.
+    For checking several candidate slots at once, prefer check_availability_bulk.
+    """
+    return await check_calendar_availability_async(start_time, end_time)
+
+@tool
+async def check_availability_bulk(windows: list[list[str]]) -> str:
     """
-    return check_calendar_availability(start_time, end_time)
+    Checks several candidate time windows on the user's primary Google Calendar at once.
+    Provide a list of [start_time, end_time] pairs in ISO 8601 format with a UTC offset
+    (e.g. [["2025-06-28T09:00:00+05:30", "2025-06-28T10:00:00+05:30"]]).
+    Prefer this over multiple check_availability calls when comparing candidate slots.
+    """
+    return await check_calendar_availability_bulk_async(windows)
 
 @tool
-def book_meeting(summary: str, start_time: str, end_time: str, description: str = "", attendees: list = None) -> str:
+async def book_meeting(summary: str, start_time: str, end_time: str, description: str = "", attendees: list = None) -> str:
     """
     Creates a new event on the user's primary Google Calendar.
     Requires a summary, start time, and end time in ISO 8601 format.
     Optional fields include description and a list of attendee emails.
     """
-    return create_google_calendar_event(summary, start_time, end_time, description, attendees)
+    return await create_google_calendar_event_async(summary, start_time, end_time, description, attendees)
 
-tools = [check_availability, book_meeting, get_current_datetime]
-tool_executor = ToolExecutor(tools)
+tools = [check_availability, check_availability_bulk, book_meeting, get_current_datetime]
 
 # --- Define the LLM and Prompt ---
 # Use a powerful model like GPT-4o or similar.
@@ -66,69 +85,175 @@ tool_executor = ToolExecutor(tools)
 # You can also use other models, e.g., from Anthropic or Groq.
 llm = ChatOpenAI(model="gpt-4o", temperature=0)
 
+# Bind the tool schemas once at import time. bind_tools re-serializes every
+# tool's Pydantic schema and allocates a fresh model wrapper, so doing it
+# inside call_model repeated that work on every graph step.
+MODEL_WITH_TOOLS = llm.bind_tools(tools)
+
+# Static system prompt sent as the first message of every turn. Keeping it
+# byte-identical across turns and users lets the provider's prompt cache
+# serve the prefix (billed at a steep discount and skipping prefill work),
+# so nothing volatile — dates, user names, timestamps — may appear here.
+# The current date comes from the get_current_datetime tool instead.
+SYSTEM_PROMPT = SystemMessage(content="""You are a helpful and precise appointment-booking assistant with access to the user's primary Google Calendar.
+
+You have these tools:
+- get_current_datetime: returns the current date and time in ISO 8601 format. You do not know today's date; always call this tool before interpreting relative dates like "today", "tomorrow", "next Tuesday", or "in an hour".
+- check_availability(start_time, end_time): checks one time window for conflicts. Times must be ISO 8601 with a UTC offset, e.g. 2025-06-28T09:00:00+05:30.
+- check_availability_bulk(windows): checks several candidate windows in a single call. Pass a list of [start_time, end_time] pairs. Always prefer this over multiple check_availability calls when comparing two or more candidate slots.
+- book_meeting(summary, start_time, end_time, description, attendees): creates the event. attendees is an optional list of email addresses.
+
+Follow these rules:
+1. Resolve relative dates with get_current_datetime before calling any other tool. Never guess the date.
+2. Always check availability before booking. If the requested window is busy, relay the busy times back to the user and propose nearby alternatives; check the alternatives with check_availability_bulk.
+3. Only call book_meeting after the user has explicitly confirmed a specific start time, end time, and summary. Repeat the final details back in your confirmation message.
+4. Use the same UTC offset the user's times imply. If the user gives no timezone hints, ask rather than assume.
+5. Keep replies short and concrete: state what you checked, what you found, and the single question or confirmation you need next.
+
+Example interaction:
+User: "Can we do a sync tomorrow morning?"
+Assistant: call get_current_datetime, then ask which window works (e.g. 9:00-9:30 or 10:00-10:30), check both with check_availability_bulk, report which are free, and book only after the user picks one and confirms.""")
+
+# Cheap model used only to compress old conversation turns into a summary.
+SUMMARIZER_LLM = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+
+# Once the un-summarized transcript exceeds this many characters, the older
+# part is folded into history_summary; the most recent messages always stay
+# verbatim so the model keeps local coherence.
+HISTORY_CHAR_BUDGET = 8_000
+KEEP_RECENT_MESSAGES = 8
+
 # --- Define the agent's logic (nodes) ---
 
 # This function determines whether the agent should call a tool or respond directly.
 def should_continue(state: AgentState):
     """
-    Determines whether to continue with a tool call or end the conversation.
+    Determines whether to continue with a tool call, fan out availability
+    checks as parallel branches, or end the conversation.
     """
     last_message = state['messages'][-1]
-    if "tool_calls" in last_message.additional_kwargs:
-        # The LLM wants to call a tool, so we will call the tool node
-        return "continue"
-    else:
+    # The normalized .tool_calls attribute is provider-agnostic and already
+    # parsed; some providers populate it without mirroring the raw payload
+    # into additional_kwargs, which the old dict lookup silently missed.
+    tool_calls = getattr(last_message, "tool_calls", None) or []
+    if not tool_calls:
         # The LLM is ready to respond, so we end the graph
         return "end"
 
+    # When the LLM proposes several candidate slots it emits one
+    # check_availability call per slot. Those are always independent, so map
+    # them onto parallel graph branches with Send; LangGraph schedules the
+    # branches concurrently and merges their messages via the reducer.
+    if len(tool_calls) > 1 and all(tc['name'] == 'check_availability' for tc in tool_calls):
+        return [
+            Send("check_one_slot", {"tool_call_id": tc['id'], "args": tc['args']})
+            for tc in tool_calls
+        ]
+
+    # The LLM wants to call a tool, so we will call the tool node
+    return "continue"
+
+# One branch of the availability fan-out: checks a single candidate slot.
+async def check_one_slot(slot: dict):
+    """
+    Checks one (start_time, end_time) window and returns its ToolMessage.
+    """
+    # Mirror ToolNode's error handling on the single/mixed path: malformed
+    # args from the LLM (bad datetimes, missing fields) become an error
+    # string the model can recover from, not a crashed turn.
+    try:
+        result = await check_availability.ainvoke(slot['args'])
+    except Exception as error:
+        result = f"An error occurred while running check_availability: {error}"
+    return {"messages": [ToolMessage(tool_call_id=slot['tool_call_id'], content=result, name='check_availability')]}
+
 # This is the main agent node that runs the LLM and decides on the next action.
-def call_model(state: AgentState):
+async def call_model(state: AgentState):
     """
     This node runs the LLM to decide on the next action.
+
+    Without pruning, the full transcript is re-sent every turn and prompt
+    tokens grow quadratically over a conversation. Older turns are folded
+    into history_summary (stored in state, so it survives via the
+    checkpointer) and only the summary plus the recent tail goes to the LLM.
     """
     messages = state['messages']
-    
-    # Add tool definitions to the message history so the model knows what tools are available.
-    model_with_tools = llm.bind_tools(tools)
-    response = model_with_tools.invoke(messages)
-    
+    history_summary = state.get('history_summary')
+    summarized_upto = state.get('summarized_upto') or 0
+
+    updates = {}
+    unsummarized = messages[summarized_upto:]
+    if (len(unsummarized) > KEEP_RECENT_MESSAGES
+            and sum(len(str(m.content)) for m in unsummarized) > HISTORY_CHAR_BUDGET):
+        cut = len(messages) - KEEP_RECENT_MESSAGES
+        # Never strand ToolMessages at the head of the kept tail: walk back
+        # to the AIMessage that issued them so the pair stays together.
+        while cut > summarized_upto and isinstance(messages[cut], ToolMessage):
+            cut -= 1
+        if cut > summarized_upto:
+            transcript = "\n".join(f"{m.type}: {m.content}" for m in messages[summarized_upto:cut])
+            summary_response = await SUMMARIZER_LLM.ainvoke([
+                SystemMessage(content="Summarize this scheduling conversation in a few sentences. Keep every concrete detail: proposed times, availability results, attendee emails, and decisions made."),
+                HumanMessage(content=transcript),
+            ])
+            history_summary = (f"{history_summary}\n{summary_response.content}"
+                               if history_summary else summary_response.content)
+            summarized_upto = cut
+            updates = {"history_summary": history_summary, "summarized_upto": summarized_upto}
+
+    # The static prompt goes first so every turn shares an identical,
+    # cacheable prefix; the (volatile) history summary comes after it,
+    # followed by the recent transcript tail.
+    context = [SYSTEM_PROMPT]
+    if history_summary:
+        context.append(SystemMessage(content=f"Summary of the earlier conversation:\n{history_summary}"))
+    context.extend(messages[summarized_upto:])
+
+    # Await the OpenAI round-trip instead of blocking on it, so concurrent
+    # /chat requests can share the event loop while this one waits.
+    response = await MODEL_WITH_TOOLS.ainvoke(context)
+
     # If the model decides to call a tool, the response will have 'tool_calls' in additional_kwargs.
     # We update the state with the model's message.
-    return {"messages": [response]}
+    return {"messages": [response], **updates}
 
-# This node executes the tool call decided by the LLM.
-def call_tool(state: AgentState):
+# This node derives state transitions from the latest batch of tool results.
+# Tool execution itself is handled by the prebuilt ToolNode, which runs the
+# calls concurrently and emits one ToolMessage per call.
+def classify_action(state: AgentState):
     """
-    This node executes the tool call and updates the state with the result.
+    Inspects the trailing ToolMessages and updates action_needed and
+    calendar_check_result accordingly.
     """
-    last_message = state['messages'][-1]
-    tool_calls = last_message.additional_kwargs.get("tool_calls", [])
-    
-    # Execute all tool calls in parallel.
-    outputs = []
-    for tool_call in tool_calls:
-        tool_name = tool_call['function']['name']
-        tool_args = tool_call['function']['arguments']
-        
-        # Execute the tool and append the result.
-        result = tool_executor.invoke([tool_call])
-        outputs.append(ToolMessage(tool_call_id=tool_call['id'], content=json.dumps(result)))
-        
+    trailing = []
+    for message in reversed(state['messages']):
+        if not isinstance(message, ToolMessage):
+            break
+        trailing.append(message)
+    trailing.reverse()
+
+    action_needed = state.get('action_needed')
+    calendar_check_result = state.get('calendar_check_result')
+    for message in trailing:
+        content = message.content if isinstance(message.content, str) else str(message.content)
+
         # Update state based on tool output
-        if tool_name == 'check_availability':
-            state['calendar_check_result'] = result
-            state['action_needed'] = 'propose_slots' if 'free' in result.lower() else 'ask_for_new_time'
-        elif tool_name == 'book_meeting':
-            state['action_needed'] = 'confirm_booking'
+        if message.name in ('check_availability', 'check_availability_bulk'):
+            calendar_check_result = content
+            action_needed = 'propose_slots' if 'free' in content.lower() else 'ask_for_new_time'
+        elif message.name == 'book_meeting':
+            action_needed = 'confirm_booking'
 
-    return {"messages": outputs, "action_needed": state.get('action_needed')}
+    return {"action_needed": action_needed, "calendar_check_result": calendar_check_result}
 
 # --- Build the LangGraph workflow ---
 workflow = StateGraph(AgentState)
 
 # Add nodes to the graph
 workflow.add_node("call_model", call_model)
-workflow.add_node("call_tool", call_tool)
+workflow.add_node("call_tool", ToolNode(tools))
+workflow.add_node("check_one_slot", check_one_slot)
+workflow.add_node("post_tool", classify_action)
 
 # Set the entry point
 workflow.add_edge(START, "call_model")
@@ -140,8 +265,12 @@ workflow.add_conditional_edges(
     {"continue": "call_tool", "end": END}
 )
 
-# After the tool is called, we always go back to the model to generate a response.
-workflow.add_edge("call_tool", "call_model")
+# After the tools run (either path), classify their results into state,
+# then go back to the model to generate a response. The fan-out branches
+# all join at post_tool, which runs once with the merged messages.
+workflow.add_edge("call_tool", "post_tool")
+workflow.add_edge("check_one_slot", "post_tool")
+workflow.add_edge("post_tool", "call_model")
 
 # Compile the graph
 app = workflow.compile()
@@ -1,12 +1,17 @@
+import asyncio
+
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
+import orjson
 from pydantic import BaseModel
-from typing import List, Dict, Any
+from typing import TypedDict, Annotated, List, Dict, Any
+from cachetools import LRUCache, TTLCache
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, ToolMessage
-from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 from langgraph.graph import START, StateGraph
 from langgraph.graph.message import add_messages
-import json
+import aiosqlite
 
 # --- Start: Fix for ModuleNotFoundError ---
 # The original import `from backend.agent import app as langgraph_app` is failing.
@@ -23,8 +28,12 @@ import json
 
 # Placeholder for langgraph_app so the API can run without the actual agent file.
 # This placeholder simulates the expected structure of a compiled LangGraph application.
-class MessagesState(BaseModel):
-    messages: List[BaseMessage]
+# TypedDict state (matching AgentState in backend/agent.py) skips the Pydantic
+# re-validation of every message that a BaseModel state would pay on each
+# graph step; Pydantic stays where validation is wanted, on the request and
+# response DTOs below.
+class MessagesState(TypedDict):
+    messages: Annotated[List[BaseMessage], add_messages]
 
 def placeholder_agent_logic(state: MessagesState):
     # Simulate a simple echo agent
@@ -38,19 +47,30 @@ workflow.add_node("agent", placeholder_agent_logic)
 workflow.set_entry_point("agent")
 workflow.set_finish_point("agent")
 
+# Set up memory/persistence for the conversation.
+# This is crucial for maintaining state across turns in the conversation.
+# One shared checkpointer for the whole process: a plain ":memory:" database
+# is private to its connection, so a second saver (or any future connection
+# pooling) would silently see an empty store; the shared-cache URI keeps it
+# in-memory but visible to every connection in this process. The async saver
+# is required because every call site is async (ainvoke / astream_events) —
+# the sync SqliteSaver's a* methods just raise NotImplementedError — and it
+# keeps checkpoint writes off the event loop. The aiosqlite connection is
+# connected lazily on first use, so creating it at import time is fine.
+checkpointer = AsyncSqliteSaver(
+    aiosqlite.connect("file:agent_memory?mode=memory&cache=shared", uri=True)
+)
+
 # Compile the placeholder graph
-langgraph_app = workflow.compile(checkpointer=SqliteSaver.from_conn_string(":memory:"))
+langgraph_app = workflow.compile(checkpointer=checkpointer)
 
 # --- End: Fix ---
 
-
-# Set up memory/persistence for the conversation
-# This is crucial for maintaining state across turns in the conversation.
-memory = SqliteSaver.from_conn_string(":memory:")
-
 app = FastAPI(
     title="Google Calendar Booking Agent API",
     description="A FastAPI backend for a conversational AI agent that books appointments on Google Calendar.",
+    # orjson serializes responses several times faster than stdlib json.
+    default_response_class=ORJSONResponse,
 )
 
 # Configure CORS to allow the Streamlit frontend to communicate with the backend
@@ -68,6 +88,30 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# --- Message coalescing (per conversation thread) ---
+# A fast burst of messages ("book it" / "with alice@" / "make it 30 min")
+# would otherwise trigger one full LLM + tool loop per message. Each request
+# enqueues its message, then whichever request wins the per-thread lock
+# drains the queue (waiting a short debounce window for stragglers) and runs
+# the agent once over the whole batch. Requests whose message was absorbed
+# into another request's batch return that batch's response.
+#
+# Coalescing deliberately applies only to this non-streaming path: debouncing
+# /chat/stream would delay time-to-first-token, which is that endpoint's whole
+# point. The per-thread lock, however, is shared with /chat/stream so a
+# streaming run and a coalesced run can never interleave on one thread.
+#
+# The maps are bounded so they don't grow one entry per thread_id forever
+# (same approach as the freebusy TTL cache in tools.py). They are only
+# touched from the event loop, so no extra locking is needed; LRU access
+# keeps active threads' entries fresh, and 1024 concurrent-ish threads is
+# far above anything this service sees before eviction could matter.
+COALESCE_DEBOUNCE_SECONDS = 0.25
+
+_pending_messages: LRUCache = LRUCache(maxsize=1024)
+_thread_locks: LRUCache = LRUCache(maxsize=1024)
+_last_responses: TTLCache = TTLCache(maxsize=1024, ttl=300)
+
 class ChatRequest(BaseModel):
     user_id: str
     message: str
@@ -91,23 +135,56 @@ async def chat_endpoint(request: ChatRequest):
 
     config = {"configurable": {"thread_id": thread_id}}
 
-    # Create the initial state with the user's message
-    input_message = HumanMessage(content=message)
+    queue = _pending_messages.setdefault(thread_id, asyncio.Queue())
+    lock = _thread_locks.setdefault(thread_id, asyncio.Lock())
+    queue.put_nowait(message)
+
+    async with lock:
+        # Drain everything queued for this thread, waiting one debounce
+        # window for stragglers so a burst becomes a single agent run.
+        batch: List[str] = []
+        while True:
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout=COALESCE_DEBOUNCE_SECONDS))
+            except asyncio.TimeoutError:
+                break
+
+        if not batch:
+            # A concurrent request already absorbed our message into its
+            # batch and ran the agent; hand back that run's response.
+            cached = _last_responses.get(thread_id)
+            if cached is not None:
+                return cached
+            return ChatResponse(
+                response="Your message was merged into an in-flight request. Please check the latest reply.",
+                thread_id=thread_id,
+            )
+
+        if len(batch) == 1:
+            content = batch[0]
+        else:
+            content = "\n".join(f"[msg {i + 1}] {m}" for i, m in enumerate(batch))
+
+        # Create the initial state with the (possibly coalesced) user message
+        input_message = HumanMessage(content=content)
 
+        response = await _run_agent(input_message, config, thread_id)
+        _last_responses[thread_id] = response
+        return response
+
+async def _run_agent(input_message: HumanMessage, config: Dict[str, Any], thread_id: str) -> ChatResponse:
+    """Runs one agent turn and shapes the final state into a ChatResponse."""
     try:
-        # Invoke the LangGraph agent with the user's message
-        # Use .stream for streaming UI, or .invoke for the final state.
-        final_state = None
-        # The placeholder app uses a slightly different state structure,
-        # so we invoke it directly with the dictionary.
-        async for event in langgraph_app.astream_events(
+        # Invoke the LangGraph agent with the user's message.
+        # ainvoke returns the final state directly; the previous
+        # astream_events loop paid for per-node callback events and
+        # intermediate serialization just to pick out the last one.
+        # (If streaming to the UI is wanted later, use astream for state
+        # deltas rather than the astream_events debug stream.)
+        final_state = await langgraph_app.ainvoke(
             {"messages": [input_message]},
             config=config,
-            version="v2"
-        ):
-            if event["event"] == "on_chain_end":
-                final_state = event["data"]["output"]
-
+        )
 
         # The final state is a dictionary, we want the messages from it.
         ai_response_message = None
@@ -139,6 +216,58 @@ async def chat_endpoint(request: ChatRequest):
         print(f"Error invoking LangGraph agent: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """
+    Streams the agent's answer token-by-token as server-sent events.
+
+    The non-streaming /chat endpoint is kept for clients that want the
+    final state in one response; this one exists so the UI can render
+    tokens as they arrive instead of showing a spinner for the whole turn.
+
+    Streaming turns are not coalesced (a debounce window would delay the
+    first token), but they take the same per-thread lock as /chat so a
+    streaming run can't interleave with a coalesced run on this thread.
+    """
+    thread_id = request.user_id
+    config = {"configurable": {"thread_id": thread_id}}
+    input_message = HumanMessage(content=request.message)
+    lock = _thread_locks.setdefault(thread_id, asyncio.Lock())
+
+    async def event_stream():
+        try:
+            final_state = None
+            async with lock:
+                async for event in langgraph_app.astream_events(
+                    {"messages": [input_message]},
+                    config=config,
+                    version="v2",
+                ):
+                    if event["event"] == "on_chat_model_stream":
+                        chunk = event["data"]["chunk"]
+                        if chunk.content:
+                            # JSON-wrap each token so newlines inside the content
+                            # can't break the SSE framing.
+                            yield b"data: " + orjson.dumps({"token": chunk.content}) + b"\n\n"
+                    elif event["event"] == "on_chain_end":
+                        final_state = event["data"]["output"]
+
+            # Not every run streams model tokens (a node can return an
+            # AIMessage without invoking a chat model), so the terminal event
+            # carries the final response text for clients that saw none.
+            response_text = None
+            if isinstance(final_state, dict) and final_state.get('messages'):
+                for msg in reversed(final_state['messages']):
+                    if isinstance(msg, AIMessage):
+                        response_text = msg.content
+                        break
+            yield b"data: " + orjson.dumps({"done": True, "thread_id": thread_id, "response": response_text}) + b"\n\n"
+        except Exception as e:
+            print(f"Error streaming from LangGraph agent: {e}")
+            yield b"data: " + orjson.dumps({"error": str(e)}) + b"\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
 @app.get("/")
 def read_root():
     return {"message": "Google Calendar Booking Agent API is running."}
\ No newline at end of file
@@ -1,20 +1,49 @@
 import os
+import asyncio
 import datetime
+import threading
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential_jitter
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
+import google_auth_httplib2
+import httplib2
 from googleapiclient.errors import HttpError
 from pydantic import BaseModel, Field
+from cachetools import TTLCache
 import json
 
 # If modifying these scopes, delete the file token.json.
 SCOPES = ['https://www.googleapis.com/auth/calendar']
 
-def get_calendar_service():
-    """Shows basic usage of the Google Calendar API.
-    Prints the start and name of the next 10 events on the user's calendar.
-    """
+# Cached Calendar service so every tool call doesn't re-read token.json,
+# re-parse credentials and rebuild the HTTP client. Guarded by a lock so
+# concurrent tool calls don't race the first initialization.
+_service_singleton = None
+_service_creds = None
+_service_lock = threading.Lock()
+
+# httplib2.Http is not thread-safe, and tool calls run concurrently in
+# worker threads (asyncio.to_thread). Credentials are shared, but each
+# thread gets its own AuthorizedHttp so in-flight requests never interleave
+# on one connection; the per-thread connection still stays warm because the
+# to_thread pool reuses its threads.
+_thread_http = threading.local()
+
+def _authorized_http():
+    """Returns this thread's AuthorizedHttp, rebuilt if credentials changed."""
+    creds = _service_creds
+    http = getattr(_thread_http, 'http', None)
+    if http is None or getattr(_thread_http, 'creds', None) is not creds:
+        http = google_auth_httplib2.AuthorizedHttp(
+            creds, http=httplib2.Http(timeout=10))
+        _thread_http.http = http
+        _thread_http.creds = creds
+    return http
+
+def _load_credentials():
+    """Loads (and refreshes/creates) the user's OAuth credentials."""
     creds = None
     # The file token.json stores the user's access and refresh tokens, and is
     # created automatically when the authorization flow completes for the first
@@ -32,8 +61,82 @@ def get_calendar_service():
         # Save the credentials for the next run
         with open('token.json', 'w') as token:
             token.write(creds.to_json())
-    
-    return build('calendar', 'v3', credentials=creds)
+
+    return creds
+
+def get_calendar_service():
+    """Returns a shared Google Calendar service object.
+
+    The service is built once and reused across tool calls; it is only
+    rebuilt when the cached credentials expire.
+    """
+    global _service_singleton, _service_creds
+    if _service_singleton is not None and _service_creds.valid:
+        return _service_singleton
+
+    with _service_lock:
+        # Re-check inside the lock in case another caller just rebuilt it.
+        if _service_singleton is not None and _service_creds.valid:
+            return _service_singleton
+
+        creds = _load_credentials()
+        # The service only carries the (static) API surface; actual requests
+        # are executed through the per-thread AuthorizedHttp above, which
+        # keeps each worker thread's TCP+TLS connection warm instead of
+        # paying a fresh handshake per call. static_discovery skips the
+        # discovery-document fetch entirely and cache_discovery avoids the
+        # (noisy, deprecated) file cache.
+        service = build('calendar', 'v3', credentials=creds,
+                        cache_discovery=False, static_discovery=True)
+        _service_creds = creds
+        _service_singleton = service
+
+    return _service_singleton
+
+# Calendar API calls now fan out in parallel (gather / Send branches), so a
+# burst can exceed the per-user QPS quota and trigger 429s whose backoff
+# would erase the parallelism win. Cap in-flight calls and retry the two
+# transient statuses with jittered exponential backoff.
+_gcal_sem = asyncio.Semaphore(5)
+
+def _is_retryable_http_error(error):
+    return isinstance(error, HttpError) and error.resp.status in (429, 503)
+
+@retry(retry=retry_if_exception(_is_retryable_http_error),
+       wait=wait_exponential_jitter(initial=1, max=10),
+       stop=stop_after_attempt(4), reraise=True)
+def _execute_with_retry(request):
+    """Executes a googleapiclient request, retrying rate-limit (429) and
+    unavailable (503) responses. Runs over the calling thread's own HTTP
+    connection, since httplib2 can't be shared across threads."""
+    return request.execute(http=_authorized_http())
+
+def _as_aware_utc(value: datetime.datetime) -> datetime.datetime:
+    """Normalizes a datetime to aware UTC so comparisons never mix naive and
+    aware values (which raises TypeError). Naive inputs are taken as UTC."""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=datetime.timezone.utc)
+    return value.astimezone(datetime.timezone.utc)
+
+# Short-lived cache for freebusy results: users re-check the same window
+# repeatedly while negotiating a slot, and each hit saves a full HTTPS
+# round-trip. 30s TTL keeps results fresh enough for a live calendar.
+# TTLCache is not thread-safe and tool calls run in concurrent to_thread
+# workers, so all access goes through the lock (same pattern as the service
+# singleton above).
+_freebusy_cache = TTLCache(maxsize=256, ttl=30)
+_freebusy_cache_lock = threading.Lock()
+
+def _invalidate_freebusy_cache(start_time: str, end_time: str):
+    """Drops cached availability for any window overlapping [start, end)."""
+    start = _as_aware_utc(datetime.datetime.fromisoformat(start_time))
+    end = _as_aware_utc(datetime.datetime.fromisoformat(end_time))
+    with _freebusy_cache_lock:
+        for key in list(_freebusy_cache.keys()):
+            _, cached_start, cached_end = key
+            if (_as_aware_utc(datetime.datetime.fromisoformat(cached_start)) < end
+                    and _as_aware_utc(datetime.datetime.fromisoformat(cached_end)) > start):
+                _freebusy_cache.pop(key, None)
 
 class CheckAvailabilityInput(BaseModel):
     start_time: str = Field(description="Start time of the proposed event in ISO 8601 format (e.g., '2025-06-28T09:00:00+05:30').")
@@ -43,39 +146,99 @@ def check_calendar_availability(start_time: str, end_time: str):
     """Checks the user's primary calendar for availability within a given time range.
     Returns a list of busy time slots.
     """
+    calendar_id = 'primary'
+    cache_key = (calendar_id, start_time, end_time)
+    with _freebusy_cache_lock:
+        cached = _freebusy_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
     try:
         service = get_calendar_service()
-        
-        # We need to get the timezone for the user's calendar.
-        calendar_id = 'primary'
-        calendar_info = service.calendars().get(calendarId=calendar_id).execute()
-        timezone = calendar_info.get('timeZone', 'UTC')
-        
+
         # Convert to datetime objects
         start = datetime.datetime.fromisoformat(start_time)
         end = datetime.datetime.fromisoformat(end_time)
-        
+
+        # timeMin/timeMax carry their own UTC offsets, so we don't need the
+        # extra calendars().get() round-trip just to read the calendar's
+        # timezone; busy intervals come back unambiguous either way.
         body = {
             "timeMin": start.isoformat(),
             "timeMax": end.isoformat(),
-            "timeZone": timezone,
             "items": [{"id": calendar_id}]
         }
         
-        free_busy_query = service.freebusy().query(body=body).execute()
-        
+        free_busy_query = _execute_with_retry(service.freebusy().query(body=body))
+
         busy_slots = free_busy_query['calendars'][calendar_id]['busy']
-        
+
         if not busy_slots:
-            return "The calendar is free during this time."
+            result = "The calendar is free during this time."
         else:
             busy_list = []
             for slot in busy_slots:
                 busy_list.append(f"From {slot['start']} to {slot['end']}")
-            return f"The calendar is busy during the following times: {', '.join(busy_list)}. Please suggest a different time."
+            result = f"The calendar is busy during the following times: {', '.join(busy_list)}. Please suggest a different time."
+
+        with _freebusy_cache_lock:
+            _freebusy_cache[cache_key] = result
+        return result
+
+    except HttpError as error:
+        return f"An error occurred while checking availability: {error}"
+
+class CheckAvailabilityBulkInput(BaseModel):
+    windows: list[tuple[str, str]] = Field(description="List of (start_time, end_time) pairs in ISO 8601 format (e.g., [('2025-06-28T09:00:00+05:30', '2025-06-28T10:00:00+05:30')]).")
+
+def _overlaps(busy_start, busy_end, window_start, window_end):
+    """Returns True if the busy interval intersects the window."""
+    return busy_start < window_end and busy_end > window_start
+
+def check_calendar_availability_bulk(windows: list[tuple[str, str]]):
+    """Checks several proposed time windows in a single freebusy round-trip.
+
+    Issues one query spanning min(start) .. max(end) and intersects the
+    returned busy intervals with each window locally, instead of one HTTPS
+    round-trip per window.
+    """
+    if not windows:
+        return "No time windows were provided to check."
+    try:
+        service = get_calendar_service()
+
+        calendar_id = 'primary'
+        # Normalize to aware UTC: Google returns busy intervals with offsets,
+        # and comparing them against offset-naive user input raises TypeError.
+        parsed = [(_as_aware_utc(datetime.datetime.fromisoformat(s)), _as_aware_utc(datetime.datetime.fromisoformat(e))) for s, e in windows]
+
+        # As in check_calendar_availability, the offset-qualified bounds make
+        # the calendars().get() timezone lookup unnecessary.
+        body = {
+            "timeMin": min(s for s, _ in parsed).isoformat(),
+            "timeMax": max(e for _, e in parsed).isoformat(),
+            "items": [{"id": calendar_id}]
+        }
+
+        free_busy_query = _execute_with_retry(service.freebusy().query(body=body))
+
+        busy_slots = free_busy_query['calendars'][calendar_id]['busy']
+        busy_parsed = [(_as_aware_utc(datetime.datetime.fromisoformat(slot['start'])), _as_aware_utc(datetime.datetime.fromisoformat(slot['end']))) for slot in busy_slots]
+
+        # Bucket the shared busy list into each requested window client-side.
+        results = []
+        for (start, end), (start_str, end_str) in zip(parsed, windows):
+            conflicts = [f"From {bs.isoformat()} to {be.isoformat()}" for bs, be in busy_parsed if _overlaps(bs, be, start, end)]
+            if not conflicts:
+                results.append(f"{start_str} to {end_str}: free")
+            else:
+                results.append(f"{start_str} to {end_str}: busy ({', '.join(conflicts)})")
+        return "Availability for the requested windows: " + "; ".join(results)
 
     except HttpError as error:
         return f"An error occurred while checking availability: {error}"
+    except (ValueError, TypeError) as error:
+        return f"Could not parse the provided time windows (use ISO 8601, e.g. '2025-06-28T09:00:00+05:30'): {error}"
 
 class CreateEventInput(BaseModel):
     summary: str = Field(description="Summary of the event.")
@@ -112,7 +275,10 @@ def create_google_calendar_event(summary: str, start_time: str, end_time: str, d
         if attendees:
             event['attendees'] = [{'email': email} for email in attendees]
 
-        event = service.events().insert(calendarId='primary', body=event).execute()
+        event = _execute_with_retry(service.events().insert(calendarId='primary', body=event))
+        # The calendar just changed, so cached availability overlapping the
+        # new event is now stale.
+        _invalidate_freebusy_cache(start_time, end_time)
         return f"Event created: {event.get('htmlLink')}"
 
     except HttpError as error:
@@ -125,12 +291,37 @@ check_availability_tool_schema = {
     "parameters": CheckAvailabilityInput.model_json_schema()
 }
 
+check_availability_bulk_tool_schema = {
+    "name": "check_calendar_availability_bulk",
+    "description": "Checks several candidate time windows on the user's primary Google Calendar in a single query.",
+    "parameters": CheckAvailabilityBulkInput.model_json_schema()
+}
+
 create_event_tool_schema = {
     "name": "create_google_calendar_event",
     "description": "Creates a new event on the user's primary Google Calendar with the given details.",
     "parameters": CreateEventInput.model_json_schema()
 }
 
+# Async entry points for the agent's tools. The google client is synchronous,
+# so each call runs in a worker thread via asyncio.to_thread; the semaphore
+# bounds how many Calendar API requests are in flight at once so parallel
+# fan-out doesn't trip the per-user quota.
+async def check_calendar_availability_async(start_time: str, end_time: str):
+    """Async wrapper around check_calendar_availability."""
+    async with _gcal_sem:
+        return await asyncio.to_thread(check_calendar_availability, start_time, end_time)
+
+async def check_calendar_availability_bulk_async(windows: list[tuple[str, str]]):
+    """Async wrapper around check_calendar_availability_bulk."""
+    async with _gcal_sem:
+        return await asyncio.to_thread(check_calendar_availability_bulk, windows)
+
+async def create_google_calendar_event_async(summary: str, start_time: str, end_time: str, description: str = "", attendees: list[str] = None):
+    """Async wrapper around create_google_calendar_event."""
+    async with _gcal_sem:
+        return await asyncio.to_thread(create_google_calendar_event, summary, start_time, end_time, description, attendees)
+
 # This is a helper function to get the current date and time
 def get_current_datetime():
     """Returns the current date and time in ISO 8601 format."""
@@ -1,5 +1,6 @@
 import streamlit as st
-import requests
+import httpx
+import json
 import uuid
 
 # --- Backend Configuration ---
@@ -19,6 +20,10 @@ if "messages" not in st.session_state:
     st.session_state.messages = []
 if "thread_id" not in st.session_state:
     st.session_state.thread_id = None
+if "http_client" not in st.session_state:
+    # Reuse one keep-alive client across Streamlit reruns so each turn
+    # skips the TCP+TLS handshake to the backend.
+    st.session_state.http_client = httpx.Client(timeout=60.0)
 
 # Display chat messages from history
 for message in st.session_state.messages:
@@ -39,27 +44,43 @@ if prompt := st.chat_input("How can I help you schedule?"):
         "message": prompt
     }
 
-    # Send message to backend and get response
-    with st.spinner("Thinking..."):
-        try:
-            response = requests.post(f"{FASTAPI_BACKEND_URL}/chat", json=payload)
+    # Stream the response from the backend so tokens render as they arrive
+    # instead of blocking on the full turn behind a spinner.
+    def stream_agent_tokens():
+        got_token = False
+        with st.session_state.http_client.stream(
+            "POST", f"{FASTAPI_BACKEND_URL}/chat/stream", json=payload, timeout=None
+        ) as response:
             response.raise_for_status() # Raise an exception for bad status codes (4xx or 5xx)
-            agent_response = response.json()
-            
-            # Extract response content and thread_id
-            bot_response = agent_response.get("response", "Sorry, I couldn't process that. Can you please rephrase?")
-            st.session_state.thread_id = agent_response.get("thread_id")
+            for line in response.iter_lines():
+                if not line.startswith("data: "):
+                    continue
+                event = json.loads(line[len("data: "):])
+                if "token" in event:
+                    got_token = True
+                    yield event["token"]
+                elif "thread_id" in event:
+                    st.session_state.thread_id = event["thread_id"]
+                    # Runs that produced no streamed tokens still carry their
+                    # final text on the terminal event.
+                    if not got_token and event.get("response"):
+                        yield event["response"]
+                elif "error" in event:
+                    raise RuntimeError(event["error"])
 
-            # Display assistant response in chat message container
-            with st.chat_message("assistant"):
-                st.markdown(bot_response)
-            
-            # Add assistant message to chat history
-            st.session_state.messages.append({"role": "assistant", "content": bot_response})
-            
-        except requests.exceptions.ConnectionError:
-            st.error("Could not connect to the FastAPI backend. Please ensure the backend server is running.")
-            st.stop()
-        except requests.exceptions.RequestException as e:
-            st.error(f"An error occurred while communicating with the backend: {e}")
-            st.stop()
\ No newline at end of file
+    try:
+        with st.chat_message("assistant"):
+            bot_response = st.write_stream(stream_agent_tokens())
+
+        if not bot_response:
+            bot_response = "Sorry, I couldn't process that. Can you please rephrase?"
+
+        # Add assistant message to chat history
+        st.session_state.messages.append({"role": "assistant", "content": bot_response})
+
+    except httpx.ConnectError:
+        st.error("Could not connect to the FastAPI backend. Please ensure the backend server is running.")
+        st.stop()
+    except (httpx.HTTPError, RuntimeError) as e:
+        st.error(f"An error occurred while communicating with the backend: {e}")
+        st.stop()
\ No newline at end of file